@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from upload import upload_file, read_json_lines
+
+# Upload a directory or list of files with a bounded worker pool.
+# Progress is appended to a JSON-lines manifest, one {"file": path, ...} line per
+# finished file, so an interrupted run picks up where it stopped
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "8"))
+MANIFEST_PATH = os.getenv("UPLOAD_MANIFEST", ".upload_manifest.jsonl")
+
+def collect_files(paths: list) -> list:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+                files.extend(os.path.join(root, name) for name in sorted(names) if not name.startswith("."))
+        else:
+            files.append(path)
+    return [os.path.abspath(f) for f in files]
+
+# Later lines win, so a retried file's newest result replaces its earlier error
+def load_manifest(manifest_path: str) -> dict:
+    return {entry.pop("file"): entry for entry in read_json_lines(manifest_path)}
+
+# A manifest entry only counts as done if the file hasn't changed since it was uploaded
+def _is_done(entry: dict, file_path: str) -> bool:
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        # Left pending so the upload reports the error for this file
+        return False
+    return (
+        entry.get("file_url") is not None
+        and entry.get("size") == stat.st_size
+        and entry.get("mtime") == stat.st_mtime
+    )
+
+# Returns one result per file, in input order: {"file", "cid", "file_url", "commitment"} or {"file", "error"}
+def upload_batch(paths: list, workers: int = UPLOAD_WORKERS, manifest_path: str = MANIFEST_PATH) -> list:
+    files = collect_files(paths)
+    manifest = load_manifest(manifest_path)
+    manifest_lock = threading.Lock()
+
+    pending = [f for f in files if not _is_done(manifest.get(f, {}), f)]
+    print(f"📦 {len(files)} files, {len(files) - len(pending)} already done, {len(pending)} to upload")
+
+    def run(file_path):
+        try:
+            stat = os.stat(file_path)
+            entry = upload_file(file_path)
+            entry.update(size=stat.st_size, mtime=stat.st_mtime)
+        except Exception as e:
+            print(f"❌ Failed {file_path}: {e}")
+            entry = {"error": str(e)}
+        with manifest_lock:
+            manifest[file_path] = entry
+            manifest_file.write(json.dumps({"file": file_path, **entry}) + "\n")
+            manifest_file.flush()
+
+    with open(manifest_path, "a") as manifest_file, ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in as_completed([executor.submit(run, f) for f in pending]):
+            future.result()
+
+    results = []
+    for file_path in files:
+        entry = manifest.get(file_path, {})
+        if "error" in entry:
+            results.append({"file": file_path, "error": entry["error"]})
+        else:
+            results.append({
+                "file": file_path,
+                "cid": entry["cid"],
+                "file_url": entry["file_url"],
+                "commitment": entry.get("commitment")
+            })
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python batch_upload.py <dir_or_file> [<dir_or_file> ...]")
+        sys.exit(1)
+
+    results = upload_batch(sys.argv[1:])
+    print(json.dumps(results, indent=2))
+    failed = sum(1 for r in results if "error" in r)
+    print(f"✅ {len(results) - failed} uploaded, ❌ {failed} failed")
@@ -0,0 +1,393 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+
+# Offline benchmarks for db.py, upload.py and download.py. Local stand-in servers play
+# PostgREST + storage, Pinata and a set of IPFS gateways, with injected latency, errors
+# and payload sizes. Numbers come from the instrument.py timing hooks.
+#
+#   python benchmark.py --iterations 200 --gateway-latency 0.3,0.02,0.05 --json bench.json
+
+class StandInConfig:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def delay(self):
+        wait = self.latency + random.uniform(0, self.jitter)
+        if wait:
+            time.sleep(wait)
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms per response
+    disable_nagle_algorithm = True
+    config = StandInConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    raise ConnectionResetError("client closed mid-body")
+                size = int(line.split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(body)
+                body.extend(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, status: int, value):
+        self._send(status, json.dumps(value).encode())
+
+    def _handle(self, method: str):
+        try:
+            body = self._read_body() if method == "POST" else b""
+        except (ConnectionError, ValueError):
+            # Aborted or malformed upload; nothing left to answer
+            self.close_connection = True
+            return
+        self.config.delay()
+        if self.config.should_fail():
+            self._send_json(500, {"error": "injected failure"})
+            return
+        url = urlparse(self.path)
+        self.route(method, url.path, parse_qs(url.query), body)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_HEAD(self):
+        self._handle("HEAD")
+
+    def route(self, method: str, path: str, query: dict, body: bytes):
+        self._send_json(404, {"error": "not found"})
+
+# PostgREST tables plus the storage object API, both under one Supabase URL
+class SupabaseStandIn(StandInHandler):
+    lock = threading.Lock()
+    tables = {}
+    objects = {}
+
+    def route(self, method, path, query, body):
+        if path.startswith("/rest/v1/"):
+            self.rest(method, path[len("/rest/v1/"):], query, body)
+        elif path.startswith("/storage/v1/object/"):
+            self.storage(method, path[len("/storage/v1/object/"):], body)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def rest(self, method, table, query, body):
+        with self.lock:
+            rows = self.tables.setdefault(table, [])
+            if method == "POST":
+                new_rows = json.loads(body)
+                new_rows = new_rows if isinstance(new_rows, list) else [new_rows]
+                for row in new_rows:
+                    row.setdefault("id", len(rows) + 1)
+                    rows.append(row)
+                self._send_json(201, new_rows)
+                return
+            matches = rows
+            for column, values in query.items():
+                if column in ("select", "limit", "order"):
+                    continue
+                op, _, operand = values[0].partition(".")
+                if op == "eq":
+                    matches = [r for r in matches if str(r.get(column)) == operand]
+                elif op == "in":
+                    wanted = {v.strip('"') for v in operand.strip("()").split(",")}
+                    matches = [r for r in matches if str(r.get(column)) in wanted]
+        self._send_json(200, matches)
+
+    def storage(self, method, key, body):
+        key = unquote(key)
+        if method == "HEAD":
+            with self.lock:
+                found = key in self.objects
+            self._send(200 if found else 400, b"" if found else b'{"statusCode": "404"}')
+            return
+        if method != "POST":
+            self._send_json(404, {"error": "not found"})
+            return
+        with self.lock:
+            if key in self.objects:
+                self._send_json(400, {"statusCode": "409", "error": "Duplicate", "message": "The resource already exists"})
+                return
+            self.objects[key] = len(body)
+        self._send_json(200, {"Key": key})
+
+# Pinata pinning API: CIDs are computed from the uploaded bytes like the real service
+class PinataStandIn(StandInHandler):
+    lock = threading.Lock()
+    pinned = set()
+
+    def route(self, method, path, query, body):
+        from cid import cid_of_chunks
+        if method == "GET" and path == "/data/pinList":
+            cid = query.get("hashContains", [""])[0]
+            with self.lock:
+                rows = [{"ipfs_pin_hash": cid}] if cid in self.pinned else []
+            self._send_json(200, {"count": len(rows), "rows": rows})
+        elif method == "POST" and path == "/pinning/pinFileToIPFS":
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+            )
+            content, version = b"", 0
+            for part in message.iter_parts():
+                if part.get_param("name", header="content-disposition") == "pinataOptions":
+                    version = json.loads(part.get_content()).get("cidVersion", 0)
+                elif part.get_filename() is not None:
+                    content = part.get_payload(decode=True)
+            cid = cid_of_chunks([content], version)
+            with self.lock:
+                self.pinned.add(cid)
+            self._send_json(200, {"IpfsHash": cid, "PinSize": len(content)})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+# IPFS gateway: serves registered content by CID, streamed in chunks
+class GatewayStandIn(StandInHandler):
+    content = {}
+
+    def route(self, method, path, query, body):
+        cid = path.rsplit("/", 1)[-1]
+        data = self.content.get(cid)
+        if method != "GET" or data is None:
+            self._send_json(404, {"error": "not found"})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        for offset in range(0, len(data), 65536):
+            self.wfile.write(data[offset:offset + 65536])
+
+def start_server(handler: type, config: StandInConfig) -> str:
+    bound = type(handler.__name__, (handler,), {"config": config})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), bound)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+SCENARIOS = ("db", "db_bulk", "upload", "batch_upload", "download", "download_cached")
+
+def _floats(value: str) -> list:
+    return [float(v) for v in value.split(",")]
+
+def _scenario_names(value: str) -> list:
+    names = value.split(",")
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown scenario {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+    return names
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the supabase/ data paths")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--payload-bytes", type=int, default=1024 * 1024)
+    parser.add_argument("--db-latency", type=float, default=0.005)
+    parser.add_argument("--pinata-latency", type=float, default=0.02)
+    parser.add_argument("--gateway-latency", type=_floats, default=[0.2, 0.02, 0.05],
+                        help="comma-separated, one stand-in gateway per value")
+    parser.add_argument("--gateway-error-rate", type=_floats, default=[0.0],
+                        help="comma-separated, reused cyclically across gateways")
+    parser.add_argument("--jitter", type=float, default=0.005)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="for the Supabase and Pinata stand-ins")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--scenarios", type=_scenario_names, default=",".join(SCENARIOS),
+                        help="comma-separated subset to run, in order")
+    parser.add_argument("--json", help="append this run's results to a JSON-lines file")
+    return parser.parse_args(argv)
+
+# Point every module at the stand-ins; must run before db/upload/download are imported
+def start_stand_ins(args, workdir: str):
+    supabase_url = start_server(SupabaseStandIn, StandInConfig(args.db_latency, args.jitter, args.error_rate))
+    pinata_url = start_server(PinataStandIn, StandInConfig(args.pinata_latency, args.jitter, args.error_rate))
+    gateways = [
+        start_server(GatewayStandIn, StandInConfig(
+            latency, args.jitter, args.gateway_error_rate[index % len(args.gateway_error_rate)]
+        )) + "/ipfs"
+        for index, latency in enumerate(args.gateway_latency)
+    ]
+    os.environ.update({
+        "SUPABASE_URL": supabase_url,
+        "SUPABASE_KEY": "bench.bench.bench",
+        "PINATA_API_URL": pinata_url,
+        "PINATA_JWT": "bench",
+        "IPFS_GATEWAYS": ",".join(gateways),
+        "IPFS_CACHE_DIR": os.path.join(workdir, ".ipfs_cache"),
+        "PINNED_INDEX_PATH": os.path.join(workdir, ".pinned_cids.jsonl"),
+        "UPLOAD_MANIFEST": os.path.join(workdir, ".upload_manifest.jsonl"),
+    })
+
+def _write_files(directory: str, count: int, size: int) -> list:
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"record-{i}.bin")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+# Failures are already counted per stage by the timing hooks; keep the run going
+def _attempt(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        return None
+
+# Runs in a scratch directory that is removed afterwards, whatever happens
+def run(args) -> dict:
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="zkh-bench-")
+    try:
+        return _run(args, workdir)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def _run(args, workdir: str) -> dict:
+    start_stand_ins(args, workdir)
+    os.chdir(workdir)
+
+    import instrument
+    instrument.enable()
+    import db
+    import upload
+    import download
+    import batch_upload
+    from cid import cid_of_chunks
+
+    n = args.iterations
+    patients = [f"GPATIENT{i}" for i in range(max(1, n // 10))]
+    providers = [f"GPROVIDER{i}" for i in range(5)]
+    # Seed users straight into the stand-in so injected errors can't break the fixtures
+    SupabaseStandIn.tables["app_users"] = [
+        {"id": index + 1, "wallet": wallet, "role": "PRO" if wallet in providers else "PAT"}
+        for index, wallet in enumerate(patients + providers)
+    ]
+
+    records = [{
+        "cid": f"QmBench{i}",
+        "file_url": f"{os.environ['SUPABASE_URL']}/storage/v1/object/public/medical-records/QmBench{i}",
+        "patient_wallet": patients[i % len(patients)],
+        "provider_wallet": providers[i % len(providers)]
+    } for i in range(n)]
+
+    # Each scenario is (setup, body); only the body is timed
+    def scenario_db():
+        db.invalidate_user_cache()
+        for record in records:
+            _attempt(db.add_medical_record, **record)
+
+    def scenario_db_bulk():
+        db.invalidate_user_cache()
+        _attempt(db.add_medical_records_bulk, records)
+
+    single_files = []
+    batch_dir = os.path.join(workdir, "batch")
+
+    def setup_upload():
+        single_files.extend(_write_files(os.path.join(workdir, "single"), n, args.payload_bytes))
+
+    def scenario_upload():
+        for path in single_files:
+            _attempt(upload.upload_file, path)
+
+    def scenario_batch_upload():
+        batch_upload.upload_batch([batch_dir], workers=args.workers)
+
+    cids = []
+    for i in range(n):
+        data = os.urandom(args.payload_bytes)
+        cid = cid_of_chunks([data])
+        GatewayStandIn.content[cid] = data
+        cids.append(cid)
+
+    def scenario_download():
+        for cid in cids:
+            _attempt(download.stream_ipfs_to_supabase, cid, use_cache=False)
+
+    # Warm the CID cache first so the timed pass measures verified local reads
+    def setup_download_cached():
+        for cid in cids:
+            _attempt(download.download_from_ipfs, cid)
+
+    def scenario_download_cached():
+        for cid in cids:
+            _attempt(download.download_from_ipfs, cid)
+
+    scenarios = {
+        "db": (None, scenario_db),
+        "db_bulk": (None, scenario_db_bulk),
+        "upload": (setup_upload, scenario_upload),
+        "batch_upload": (lambda: _write_files(batch_dir, n, args.payload_bytes), scenario_batch_upload),
+        "download": (None, scenario_download),
+        "download_cached": (setup_download_cached, scenario_download_cached),
+    }
+
+    results = {"timestamp": time.time(), "args": vars(args), "scenarios": {}}
+    stdout = sys.stdout
+    for name in args.scenarios:
+        setup, body = scenarios[name]
+        # The data paths print progress per item; keep the benchmark output readable
+        sys.stdout = open(os.devnull, "w")
+        try:
+            if setup:
+                setup()
+            instrument.reset()
+            start = time.perf_counter()
+            body()
+            wall = time.perf_counter() - start
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        results["scenarios"][name] = {
+            "wall_s": wall,
+            "items_per_s": n / wall if wall else 0.0,
+            "stages": instrument.report()
+        }
+        print(f"\n== {name}: {n} items in {wall:.2f}s ({n / wall:.1f}/s)")
+        instrument.print_report()
+    return results
+
+if __name__ == "__main__":
+    args = parse_args()
+    # run() switches into a scratch directory, so resolve the output path first
+    json_path = os.path.abspath(args.json) if args.json else None
+    results = run(args)
+    if json_path:
+        with open(json_path, "a") as f:
+            f.write(json.dumps(results) + "\n")
@@ -0,0 +1,199 @@
+import hashlib
+import sys
+
+# Compute IPFS CIDs locally, matching what `ipfs add` / Pinata produce with
+# default settings: 256 KiB fixed-size chunks, balanced DAG, 174 links per node.
+# CIDv0 uses dag-pb leaves; CIDv1 uses raw leaves (as `--cid-version=1` implies).
+CHUNK_SIZE = 262144
+MAX_LINKS = 174
+
+SHA2_256 = 0x12
+DAG_PB = 0x70
+RAW = 0x55
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+BASE32_ALPHABET = "abcdefghijklmnopqrstuvwxyz234567"
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _field(number: int, value: bytes) -> bytes:
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
+
+def _uint_field(number: int, value: int) -> bytes:
+    return _varint(number << 3) + _varint(value)
+
+def _base58(data: bytes) -> str:
+    n = int.from_bytes(data, "big")
+    out = ""
+    while n:
+        n, rem = divmod(n, 58)
+        out = BASE58_ALPHABET[rem] + out
+    return "1" * (len(data) - len(data.lstrip(b"\0"))) + out
+
+def _base32(data: bytes) -> str:
+    bits = int.from_bytes(data, "big")
+    length = len(data) * 8
+    pad = -length % 5
+    bits <<= pad
+    return "".join(
+        BASE32_ALPHABET[(bits >> shift) & 0x1F]
+        for shift in range(length + pad - 5, -1, -5)
+    )
+
+# UnixFS Data message with Type=File
+def _unixfs_file(data: bytes = b"", filesize: int = 0, blocksizes: list = ()) -> bytes:
+    out = _uint_field(1, 2)
+    if data:
+        out += _field(2, data)
+    out += _uint_field(3, filesize)
+    for size in blocksizes:
+        out += _uint_field(4, size)
+    return out
+
+# dag-pb PBNode: links (field 2) are written before data (field 1)
+def _pb_node(data: bytes, links: list = ()) -> bytes:
+    out = b""
+    for cid, tsize in links:
+        out += _field(2, _field(1, cid) + _field(2, b"") + _uint_field(3, tsize))
+    return out + _field(1, data)
+
+class _Builder:
+    def __init__(self, version: int):
+        self.version = version
+        # levels[i] holds (cid bytes, cumulative block size, file bytes) nodes at depth i
+        self.levels = [[]]
+        self.leaves = 0
+
+    def _cid(self, codec: int, block: bytes) -> bytes:
+        multihash = bytes([SHA2_256, 32]) + hashlib.sha256(block).digest()
+        if self.version == 0:
+            return multihash
+        return bytes([1]) + _varint(codec) + multihash
+
+    def add_chunk(self, chunk: bytes):
+        if self.version == 0:
+            block = _pb_node(_unixfs_file(chunk, len(chunk)))
+            node = (self._cid(DAG_PB, block), len(block), len(chunk))
+        else:
+            node = (self._cid(RAW, chunk), len(chunk), len(chunk))
+        self.leaves += 1
+        self._push(0, node)
+
+    def _push(self, level: int, node):
+        if level == len(self.levels):
+            self.levels.append([])
+        self.levels[level].append(node)
+        if len(self.levels[level]) == MAX_LINKS:
+            self._push(level + 1, self._parent(self.levels[level]))
+            self.levels[level] = []
+
+    def _parent(self, children: list):
+        filesize = sum(child[2] for child in children)
+        data = _unixfs_file(filesize=filesize, blocksizes=[child[2] for child in children])
+        block = _pb_node(data, [(child[0], child[1]) for child in children])
+        tsize = len(block) + sum(child[1] for child in children)
+        return (self._cid(DAG_PB, block), tsize, filesize)
+
+    def finish(self) -> bytes:
+        level = 0
+        while True:
+            nodes = self.levels[level]
+            is_top = all(not higher for higher in self.levels[level + 1:])
+            if is_top and len(nodes) == 1:
+                # A single-chunk file is its own root
+                return nodes[0][0]
+            if nodes:
+                self._push(level + 1, self._parent(nodes))
+                self.levels[level] = []
+            level += 1
+
+def encode_cid(cid: bytes) -> str:
+    if cid[0] == SHA2_256:
+        return _base58(cid)
+    return "b" + _base32(cid)
+
+# Incremental CID computation: feed bytes with update(), read the result with cid()
+class CidHasher:
+    def __init__(self, version: int = 0):
+        self.builder = _Builder(version)
+        self.buffer = bytearray()
+
+    def update(self, piece: bytes):
+        self.buffer.extend(piece)
+        while len(self.buffer) >= CHUNK_SIZE:
+            self.builder.add_chunk(bytes(self.buffer[:CHUNK_SIZE]))
+            del self.buffer[:CHUNK_SIZE]
+
+    def cid(self) -> str:
+        if self.buffer or self.builder.leaves == 0:
+            self.builder.add_chunk(bytes(self.buffer))
+            self.buffer.clear()
+        return encode_cid(self.builder.finish())
+
+# Compute the CID of a stream of bytes in one pass, buffering at most one chunk
+def cid_of_chunks(chunks, version: int = 0) -> str:
+    hasher = CidHasher(version)
+    for piece in chunks:
+        hasher.update(piece)
+    return hasher.cid()
+
+def cid_of_file(file_path: str, version: int = 0) -> str:
+    def read_chunks():
+        with open(file_path, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                yield chunk
+    return cid_of_chunks(read_chunks(), version)
+
+def cid_version(cid: str) -> int:
+    return 0 if cid.startswith("Qm") else 1
+
+# Reference CIDs from ipfs-unixfs-importer (the importer `ipfs add` / Pinata defaults follow).
+# "pattern" inputs are byte i = i % 251, so every 256 KiB leaf differs
+KNOWN_CIDS = [
+    ("empty", 0, b"", "QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH",
+     "bafkreihdwdcefgh4dqkjv67uzcmw7ojee6xedzdetojuzjevtenxquvyku"),
+    ("single chunk", 12, b"hello world\n", "QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o",
+     "bafkreifjjcie6lypi6ny7amxnfftagclbuxndqonfipmb64f2km2devei4"),
+    ("two leaves", CHUNK_SIZE + 1, None, "QmUSjGawaz4ptvREcMKSMJneWCa5j8dAz2wSAAvHtW2rnB",
+     "bafybeiexg2oqkfnj56l7fcmawswqbijt5shq4b5rg6a546uwpkqqzwjioi"),
+    ("two link levels", MAX_LINKS * CHUNK_SIZE + 1, None, "QmTedsTekQQkgACJXb1sPZSW8bLdS9LPMrT7L4YdjNRd4n",
+     "bafybeib4y7ghw2rq7bracc4xwtxrbzo7cfvagdpte2tmrkgwl6dyard3cm"),
+]
+
+def _pattern_chunks(size: int):
+    period = bytes(range(251)) * (CHUNK_SIZE // 251 + 2)
+    for offset in range(0, size, CHUNK_SIZE):
+        start = offset % 251
+        yield period[start:start + min(CHUNK_SIZE, size - offset)]
+
+# Check the DAG builder against the reference CIDs; returns the names of failing cases
+def self_check() -> list:
+    failures = []
+    for name, size, data, v0, v1 in KNOWN_CIDS:
+        for version, expected in ((0, v0), (1, v1)):
+            chunks = [data] if data is not None else _pattern_chunks(size)
+            if cid_of_chunks(chunks, version) != expected:
+                failures.append(f"{name} (CIDv{version})")
+    return failures
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python cid.py <file_path> [0|1] | --self-check")
+        sys.exit(1)
+
+    if sys.argv[1] == "--self-check":
+        failures = self_check()
+        print("❌ Failed: " + ", ".join(failures) if failures else "✅ All known CIDs match")
+        sys.exit(1 if failures else 0)
+
+    version = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    print(cid_of_file(sys.argv[1], version))
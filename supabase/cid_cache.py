@@ -0,0 +1,98 @@
+import os
+import tempfile
+from cid import CidHasher, cid_of_file, cid_version
+
+# On-disk, content-addressed cache of IPFS objects, one file per CID.
+# Recency is tracked with file mtimes so several processes can share a directory;
+# writes land in a temp file and are renamed into place once the CID checks out.
+CACHE_DIR = os.getenv("IPFS_CACHE_DIR", ".ipfs_cache")
+CACHE_MAX_BYTES = int(os.getenv("IPFS_CACHE_MAX_BYTES", str(1024 ** 3)))
+READ_SIZE = 262144
+
+def _path(cid: str) -> str:
+    return os.path.join(CACHE_DIR, cid)
+
+# Return the cached path for a CID, or None; bytes are re-hashed before being served
+def get(cid: str):
+    path = _path(cid)
+    if not os.path.exists(path):
+        return None
+    try:
+        if cid_of_file(path, cid_version(cid)) != cid:
+            print(f"⚠️ Cached {cid} failed verification, evicting")
+            os.remove(path)
+            return None
+        os.utime(path)
+    except FileNotFoundError:
+        # Evicted by another process between the check and the read
+        return None
+    return path
+
+def iter_cached(path: str):
+    with open(path, "rb") as f:
+        while chunk := f.read(READ_SIZE):
+            yield chunk
+
+# Pass chunks through unchanged while writing them to the cache. The entry is only
+# published if the stream is read to the end and hashes back to the CID; once it
+# outgrows CACHE_MAX_BYTES it can never be published, so spooling stops there
+def tee(cid: str, chunks):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=".tmp-")
+    f = os.fdopen(fd, "wb")
+    hasher = CidHasher(cid_version(cid))
+    size = 0
+    published = False
+    try:
+        for chunk in chunks:
+            if f is not None:
+                size += len(chunk)
+                if size > CACHE_MAX_BYTES:
+                    f.close()
+                    f = None
+                    os.remove(tmp_path)
+                else:
+                    f.write(chunk)
+                    hasher.update(chunk)
+            yield chunk
+        if f is None:
+            return
+        f.close()
+        f = None
+        if hasher.cid() != cid:
+            print(f"⚠️ Content for {cid} does not match its CID, not caching")
+            return
+        os.replace(tmp_path, _path(cid))
+        published = True
+        evict()
+    finally:
+        if f is not None:
+            f.close()
+        if not published and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# Delete least recently used entries until the cache fits in CACHE_MAX_BYTES
+def evict(max_bytes: int = None):
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    for entry in os.scandir(CACHE_DIR):
+        if entry.name.startswith(".tmp-") or not entry.is_file():
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def clear():
+    evict(0)
@@ -0,0 +1,123 @@
+import os
+import sys
+import mmap
+import hashlib
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+# File commitments identical to src/zk/server.js and prove_pdf_js/hashPDF.js:
+# Poseidon(SHA-256(file)) over the BN254 scalar field, as circomlibjs computes it.
+FIELD = 21888242871839275222246405745257275088548364400416034343698204186575808495617
+FULL_ROUNDS = 8
+# circomlib's partial round counts, indexed by t - 2 (t = number of inputs + 1)
+PARTIAL_ROUNDS = [56, 57, 56, 60, 60, 63, 64, 63, 60, 66, 60, 65, 70, 60, 64, 68]
+MMAP_SLICE = 8 * 1024 * 1024
+HASH_WORKERS = int(os.getenv("COMMITMENT_WORKERS", str(os.cpu_count() or 1)))
+
+# Round constants and MDS matrix from the Poseidon reference Grain LFSR, which is
+# how circomlib generated its constants. Built once per width and reused
+@lru_cache(maxsize=None)
+def poseidon_constants(t: int):
+    rounds_p = PARTIAL_ROUNDS[t - 2]
+    bits = [int(b) for b in (
+        "01" + "0000" + format(254, "012b") + format(t, "012b") +
+        format(FULL_ROUNDS, "010b") + format(rounds_p, "010b")
+    )] + [1] * 30
+
+    def step():
+        bit = bits[62] ^ bits[51] ^ bits[38] ^ bits[23] ^ bits[13] ^ bits[0]
+        bits.pop(0)
+        bits.append(bit)
+        return bit
+
+    for _ in range(160):
+        step()
+
+    def random_element():
+        value = 0
+        for _ in range(254):
+            # Self-shrinking: keep the second bit of each pair whose first bit is 1
+            while not step():
+                step()
+            value = value << 1 | step()
+        return value
+
+    constants = []
+    while len(constants) < (FULL_ROUNDS + rounds_p) * t:
+        value = random_element()
+        if value < FIELD:
+            constants.append(value)
+
+    while True:
+        points = [random_element() % FIELD for _ in range(2 * t)]
+        if len(set(points)) == 2 * t:
+            break
+    xs, ys = points[:t], points[t:]
+    mds = [[pow(xs[i] + ys[j], FIELD - 2, FIELD) for j in range(t)] for i in range(t)]
+    return rounds_p, constants, mds
+
+# Run the permutation over many states of the same width in lockstep,
+# so each round's constants are looked up once for the whole batch
+def _permute(states: list) -> list:
+    t = len(states[0])
+    rounds_p, constants, mds = poseidon_constants(t)
+    half = FULL_ROUNDS // 2
+    for r in range(FULL_ROUNDS + rounds_p):
+        round_constants = constants[r * t:(r + 1) * t]
+        full = r < half or r >= half + rounds_p
+        for index, state in enumerate(states):
+            state = [(a + c) % FIELD for a, c in zip(state, round_constants)]
+            if full:
+                state = [pow(a, 5, FIELD) for a in state]
+            else:
+                state[0] = pow(state[0], 5, FIELD)
+            states[index] = [sum(m * a for m, a in zip(row, state)) % FIELD for row in mds]
+    return [state[0] for state in states]
+
+def poseidon(inputs: list) -> int:
+    return _permute([[0] + [x % FIELD for x in inputs]])[0]
+
+def poseidon_batch(inputs: list) -> list:
+    if not inputs:
+        return []
+    return _permute([[0] + [x % FIELD for x in values] for values in inputs])
+
+# Stream SHA-256 over a memory-mapped file; hashlib releases the GIL for each slice
+def sha256_file(file_path: str) -> bytes:
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return sha.digest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(mapped), MMAP_SLICE):
+                    sha.update(view[offset:offset + MMAP_SLICE])
+            finally:
+                view.release()
+    return sha.digest()
+
+# Decimal string for the ZK circuit input and 32-byte hex for Stellar, as server.js returns them
+def format_commitment(value: int) -> dict:
+    return {"decimal": str(value), "hex": format(value, "064x")}
+
+def commitment_from_sha256(digest: bytes) -> dict:
+    return format_commitment(poseidon([int.from_bytes(digest, "big")]))
+
+def file_commitment(file_path: str) -> dict:
+    return commitment_from_sha256(sha256_file(file_path))
+
+# SHA-256 every file on a thread pool, then run one batched Poseidon pass
+def file_commitments(file_paths: list, workers: int = HASH_WORKERS) -> list:
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        digests = list(executor.map(sha256_file, file_paths))
+    values = poseidon_batch([[int.from_bytes(d, "big")] for d in digests])
+    return [format_commitment(value) for value in values]
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python commitment.py <file_path> [<file_path> ...]")
+        sys.exit(1)
+
+    for path, result in zip(sys.argv[1:], file_commitments(sys.argv[1:])):
+        print(f"{path}: {result['decimal']}")
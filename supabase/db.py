@@ -3,6 +3,11 @@ import os
 from supabase import create_client, Client
 from dotenv import load_dotenv
 import uuid
+import time
+import threading
+from collections import OrderedDict
+from postgrest.exceptions import APIError
+from instrument import timed
 
 load_dotenv()
 
@@ -11,44 +16,96 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Wallet -> user ID cache. IDs never change once add_user creates them,
+# so entries only leave through the TTL, LRU eviction or invalidate_user_cache
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "3600"))
+
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+user_cache_stats = {"hits": 0, "misses": 0}
+
+def _cache_get(wallet: str):
+    with _user_cache_lock:
+        entry = _user_cache.get(wallet)
+        if entry and entry[1] > time.monotonic():
+            _user_cache.move_to_end(wallet)
+            user_cache_stats["hits"] += 1
+            return entry[0]
+        if entry:
+            del _user_cache[wallet]
+        user_cache_stats["misses"] += 1
+        return None
+
+def _cache_put(wallet: str, user_id) -> None:
+    with _user_cache_lock:
+        _user_cache[wallet] = (user_id, time.monotonic() + USER_CACHE_TTL)
+        _user_cache.move_to_end(wallet)
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+
+# Drop one wallet from the cache, or everything when no wallet is given
+def invalidate_user_cache(wallet: str = None) -> None:
+    with _user_cache_lock:
+        if wallet is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(wallet, None)
+
+# Look up a single user ID by wallet, going through the cache
+@timed("db.get_user_id")
+def get_user_id(wallet: str):
+    user_id = _cache_get(wallet)
+    if user_id is not None:
+        return user_id
+    result = supabase.table("app_users").select("id").eq("wallet", wallet).execute()
+    if not result.data:
+        return None
+    user_id = result.data[0]["id"]
+    _cache_put(wallet, user_id)
+    return user_id
+
 # Add a new user (PAT or PRO)
+@timed("db.add_user")
 def add_user(wallet: str, role: str) -> dict:
     assert role in ["PAT", "PRO"], "Invalid role"
     result = supabase.table("app_users").insert({
         "wallet": wallet,
         "role": role
     }).execute()
+    if result.data:
+        _cache_put(wallet, result.data[0]["id"])
     return result.data[0] if result.data else {"error": result.error}
 
 # Create a relationship between patient and provider
+@timed("db.add_relationship")
 def add_relationship(patient_wallet: str, provider_wallet: str) -> dict:
     # Get user IDs
-    pat = supabase.table("app_users").select("id").eq("wallet", patient_wallet).execute()
-    pro = supabase.table("app_users").select("id").eq("wallet", provider_wallet).execute()
+    patient_id = get_user_id(patient_wallet)
+    provider_id = get_user_id(provider_wallet)
 
-    if not pat.data or not pro.data:
+    if not patient_id or not provider_id:
         return {"error": "Patient or Provider not found"}
 
     result = supabase.table("relationships").insert({
-        "patient_id": pat.data[0]["id"],
-        "provider_id": pro.data[0]["id"]
+        "patient_id": patient_id,
+        "provider_id": provider_id
     }).execute()
     return result.data[0] if result.data else {"error": result.error}
 
 # Link an IPFS file to a patient (and optionally a provider)
-def add_medical_record(cid: str, file_url: str, patient_wallet: str, provider_wallet: str = None) -> dict:
+@timed("db.add_medical_record")
+def add_medical_record(cid: str, file_url: str, patient_wallet: str, provider_wallet: str = None, commitment: str = None) -> dict:
     # Get user IDs
-    pat = supabase.table("app_users").select("id").eq("wallet", patient_wallet).execute()
-    if not pat.data:
+    patient_id = get_user_id(patient_wallet)
+    if not patient_id:
         return {"error": "Patient not found"}
-    patient_id = pat.data[0]["id"]
 
     provider_id = None
     if provider_wallet:
-        pro = supabase.table("app_users").select("id").eq("wallet", provider_wallet).execute()
-        if not pro.data:
+        provider_id = get_user_id(provider_wallet)
+        if not provider_id:
             return {"error": "Provider not found"}
-        provider_id = pro.data[0]["id"]
 
     record = {
         "cid": cid,
@@ -56,6 +113,151 @@ def add_medical_record(cid: str, file_url: str, patient_wallet: str, provider_wa
         "patient_id": patient_id,
         "provider_id": provider_id
     }
+    # Poseidon(SHA-256) file commitment (decimal string), see commitment.py;
+    # the column comes from migrations/20261018000000_medical_records_commitment.sql
+    if commitment:
+        record["commitment"] = commitment
 
     result = supabase.table("medical_records").insert(record).execute()
     return result.data[0] if result.data else {"error": result.error}
+
+# Default rows per insert for the bulk helpers
+BULK_CHUNK_SIZE = 500
+# Wallets per `in_` lookup; the filter goes in the GET query string, and 100 Stellar
+# keys (~6 KB) stay under common 8 KB proxy URL limits
+LOOKUP_CHUNK_SIZE = 100
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+# Resolve many wallets to user IDs, querying only cache misses with batched `in_` queries.
+# With an `errors` dict, failed lookups are recorded there (wallet -> message) instead of raising
+@timed("db.get_user_ids")
+def get_user_ids(wallets: list, chunk_size: int = LOOKUP_CHUNK_SIZE, errors: dict = None) -> dict:
+    ids = {}
+    missing = []
+    for wallet in {w for w in wallets if w}:
+        user_id = _cache_get(wallet)
+        if user_id is not None:
+            ids[wallet] = user_id
+        else:
+            missing.append(wallet)
+    for chunk in _chunks(missing, chunk_size):
+        try:
+            result = supabase.table("app_users").select("id, wallet").in_("wallet", chunk).execute()
+        except Exception as e:
+            if errors is None:
+                raise
+            errors.update((wallet, str(e)) for wallet in chunk)
+            continue
+        for row in result.data or []:
+            ids[row["wallet"]] = row["id"]
+            _cache_put(row["wallet"], row["id"])
+    return ids
+
+# SQLSTATE classes PostgREST returns when specific rows are rejected:
+# 22 (invalid data) and 23 (not-null, unique, foreign key and check violations)
+ROW_ERROR_CLASSES = ("22", "23")
+
+def _row_level(error: Exception) -> bool:
+    return isinstance(error, APIError) and str(error.code or "")[:2] in ROW_ERROR_CLASSES
+
+# Insert rows in one request; a bulk insert is all-or-nothing, so when rows are
+# rejected bisect until only the bad ones are reported as errors. Transport errors
+# and 5xx fail the whole chunk: resending may duplicate rows that were committed
+def _insert_rows(table: str, rows: list, report: list):
+    try:
+        result = supabase.table(table).insert([row for _, row in rows]).execute()
+        data = result.data or []
+    except Exception as e:
+        if len(rows) == 1 or not _row_level(e):
+            for index, _ in rows:
+                report[index] = {"error": str(e)}
+            return
+        middle = len(rows) // 2
+        _insert_rows(table, rows[:middle], report)
+        _insert_rows(table, rows[middle:], report)
+        return
+    for position, (index, _) in enumerate(rows):
+        report[index] = data[position] if position < len(data) else {"error": "Insert returned no row"}
+
+# Insert prepared rows chunk by chunk, reporting per-row outcomes in order
+def _insert_bulk(table: str, rows: list, report: list, chunk_size: int) -> list:
+    for chunk in _chunks(rows, chunk_size):
+        _insert_rows(table, chunk, report)
+    return report
+
+def _user_error(wallet: str, lookup_errors: dict, missing: str) -> dict:
+    if wallet in lookup_errors:
+        return {"error": f"User lookup failed: {lookup_errors[wallet]}"}
+    return {"error": missing}
+
+# Create many patient/provider relationships at once
+# `relationships` is a list of {"patient_wallet": ..., "provider_wallet": ...}
+@timed("db.add_relationships_bulk")
+def add_relationships_bulk(relationships: list, chunk_size: int = BULK_CHUNK_SIZE) -> list:
+    lookup_errors = {}
+    ids = get_user_ids(
+        [r.get("patient_wallet") for r in relationships] +
+        [r.get("provider_wallet") for r in relationships],
+        errors=lookup_errors
+    )
+
+    report = [None] * len(relationships)
+    rows = []
+    for index, rel in enumerate(relationships):
+        patient_id = ids.get(rel.get("patient_wallet"))
+        provider_id = ids.get(rel.get("provider_wallet"))
+        if not patient_id or not provider_id:
+            failed = rel.get("patient_wallet") if not patient_id else rel.get("provider_wallet")
+            report[index] = _user_error(failed, lookup_errors, "Patient or Provider not found")
+            continue
+        rows.append((index, {
+            "patient_id": patient_id,
+            "provider_id": provider_id
+        }))
+
+    return _insert_bulk("relationships", rows, report, chunk_size)
+
+# Link many IPFS files to patients (and optionally providers) at once
+# `records` is a list of dicts with the same keys as add_medical_record's arguments
+@timed("db.add_medical_records_bulk")
+def add_medical_records_bulk(records: list, chunk_size: int = BULK_CHUNK_SIZE) -> list:
+    lookup_errors = {}
+    ids = get_user_ids(
+        [r.get("patient_wallet") for r in records] +
+        [r.get("provider_wallet") for r in records],
+        errors=lookup_errors
+    )
+
+    report = [None] * len(records)
+    rows = []
+    for index, rec in enumerate(records):
+        if not rec.get("cid") or not rec.get("file_url"):
+            report[index] = {"error": "Missing cid or file_url"}
+            continue
+
+        patient_id = ids.get(rec.get("patient_wallet"))
+        if not patient_id:
+            report[index] = _user_error(rec.get("patient_wallet"), lookup_errors, "Patient not found")
+            continue
+
+        provider_id = None
+        if rec.get("provider_wallet"):
+            provider_id = ids.get(rec["provider_wallet"])
+            if not provider_id:
+                report[index] = _user_error(rec["provider_wallet"], lookup_errors, "Provider not found")
+                continue
+
+        row = {
+            "cid": rec["cid"],
+            "file_url": rec["file_url"],
+            "patient_id": patient_id,
+            "provider_id": provider_id
+        }
+        if rec.get("commitment"):
+            row["commitment"] = rec["commitment"]
+        rows.append((index, row))
+
+    return _insert_bulk("medical_records", rows, report, chunk_size)
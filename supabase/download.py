@@ -2,8 +2,16 @@ import requests
 import sys
 import imghdr
 import os
+import itertools
+import contextvars
+import mimetypes
+import time
+import threading
+from concurrent.futures import Future, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 from supabase import create_client, Client
+import cid_cache
+from instrument import timed
 
 # Load .env credentials
 load_dotenv()
@@ -13,48 +21,276 @@ BUCKET_NAME = "medical-records"
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-# Gateways to try
-GATEWAYS = [
+# Gateways to try (IPFS_GATEWAYS overrides with a comma-separated list)
+GATEWAYS = os.getenv("IPFS_GATEWAYS", ",".join([
     "https://ipfs.io/ipfs",
     "https://gateway.pinata.cloud/ipfs",
     "https://cloudflare-ipfs.com/ipfs"
-]
+])).split(",")
 
-def download_from_ipfs(cid: str):
-    for gateway in GATEWAYS:
-        url = f"{gateway}/{cid}"
-        print(f"🔎 Trying: {url}")
+# Hedging: start the best-ranked gateway, then fire a backup every HEDGE_DELAY seconds
+GATEWAY_TIMEOUT = 10
+HEDGE_DELAY = float(os.getenv("IPFS_HEDGE_DELAY", "0.5"))
+CHUNK_SIZE = 64 * 1024
+
+# Rolling per-gateway latency/error scores, kept for the life of the process.
+# Unmeasured gateways (latency None) rank first so each one gets sampled
+STATS_ALPHA = 0.3
+_stats_lock = threading.Lock()
+gateway_stats = {gateway: {"latency": None, "error_rate": 0.0} for gateway in GATEWAYS}
+
+class FetchCancelled(Exception):
+    pass
+
+# A cancelled (losing) fetch only tells us the gateway was at least this slow
+def _record(gateway: str, latency: float, failed: bool, cancelled: bool = False):
+    with _stats_lock:
+        stats = gateway_stats.setdefault(gateway, {"latency": None, "error_rate": 0.0})
+        if cancelled:
+            stats["latency"] = max(stats["latency"] or 0.0, latency)
+            return
+        if not failed:
+            if stats["latency"] is None:
+                stats["latency"] = latency
+            else:
+                stats["latency"] += STATS_ALPHA * (latency - stats["latency"])
+        stats["error_rate"] += STATS_ALPHA * ((1.0 if failed else 0.0) - stats["error_rate"])
+
+# Order gateways by expected cost: rolling latency plus a timeout penalty per expected failure
+def rank_gateways(exclude=()):
+    with _stats_lock:
+        scores = {
+            gateway: gateway_stats.get(gateway, {"latency": None, "error_rate": 0.0})
+            for gateway in GATEWAYS
+            if gateway not in exclude
+        }
+        return sorted(
+            scores,
+            key=lambda g: (scores[g]["latency"] or 0.0) + scores[g]["error_rate"] * GATEWAY_TIMEOUT
+        )
+
+# Open a streaming response and read only its first chunk; the caller pulls the rest
+def open_gateway_stream(gateway: str, cid: str, cancel: threading.Event = None):
+    url = f"{gateway}/{cid}"
+    print(f"🔎 Trying: {url}")
+    start = time.monotonic()
+    try:
+        response = requests.get(url, timeout=GATEWAY_TIMEOUT, stream=True)
         try:
-            response = requests.get(url, timeout=10)
             response.raise_for_status()
-            content = response.content
-
-            ext = imghdr.what(None, h=content) or "bin"
-            filename = f"{cid}.{ext}"
+            chunks = response.iter_content(CHUNK_SIZE)
+            first_chunk = next(chunks, b"")
+        except Exception:
+            response.close()
+            raise
+    except Exception:
+        _record(gateway, time.monotonic() - start, failed=True)
+        raise
+    if cancel is not None and cancel.is_set():
+        response.close()
+        _record(gateway, time.monotonic() - start, failed=False, cancelled=True)
+        raise FetchCancelled(gateway)
+    _record(gateway, time.monotonic() - start, failed=False)
+    return response, chunks, first_chunk, gateway
 
-            with open(filename, "wb") as f:
-                f.write(content)
+def _close_stream(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result()[0].close()
 
-            print(f"✅ Downloaded as: {filename}")
-            return filename
+def _open_sequential(cid: str, exclude=()):
+    for gateway in rank_gateways(exclude):
+        try:
+            return open_gateway_stream(gateway, cid)
         except Exception as e:
             print(f"❌ Failed at {gateway}: {e}")
-    print("🚫 All gateways failed.")
     return None
 
+# Run fn on a daemon thread in a copy of this context, so timing hooks charge the request
+# to the caller. A blocked request can't be interrupted; daemon threads let a losing fetch
+# run out (at most GATEWAY_TIMEOUT) without holding up the caller or interpreter exit
+def _start_daemon(fn, *args) -> Future:
+    future = Future()
+    future.set_running_or_notify_cancel()
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            future.set_result(context.run(fn, *args))
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+def _open_hedged(cid: str, exclude=()):
+    pending_gateways = rank_gateways(exclude)
+    if not pending_gateways:
+        return None
+    cancel = threading.Event()
+    running = {}
+    try:
+        while pending_gateways or running:
+            if pending_gateways:
+                gateway = pending_gateways.pop(0)
+                running[_start_daemon(open_gateway_stream, gateway, cid, cancel)] = gateway
+            # Wait for a first byte, but only HEDGE_DELAY before firing the next backup
+            timeout = HEDGE_DELAY if pending_gateways else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            winner = None
+            for future in done:
+                gateway = running.pop(future)
+                if winner is not None:
+                    _close_stream(future)
+                    continue
+                try:
+                    winner = future.result()
+                except Exception as e:
+                    print(f"❌ Failed at {gateway}: {e}")
+                    continue
+                print(f"⚡ Fastest gateway: {gateway}")
+            if winner is not None:
+                return winner
+        return None
+    finally:
+        cancel.set()
+        for future in running:
+            future.add_done_callback(_close_stream)
+
+# Find a gateway serving the CID, skipping those in `exclude`;
+# returns (response, chunk iterator, first chunk, gateway) or None
+@timed("download.open_ipfs_stream")
+def open_ipfs_stream(cid: str, hedged: bool = True, exclude=()):
+    stream = _open_hedged(cid, exclude) if hedged else _open_sequential(cid, exclude)
+    if stream is None:
+        print("🚫 All gateways failed.")
+    return stream
+
+class GatewayStreamError(Exception):
+    def __init__(self, gateway: str, error: Exception):
+        super().__init__(f"{gateway}: {error}")
+        self.gateway = gateway
+
+# Yield the body; a gateway that drops mid-body is recorded as failed (opening it
+# already counted as a success) and appended to `failed` so callers can move on
+def _iter_stream(stream, failed: list = None):
+    response, chunks, first_chunk, gateway = stream
+    try:
+        if first_chunk:
+            yield first_chunk
+        try:
+            yield from chunks
+        except Exception as e:
+            _record(gateway, 0.0, failed=True)
+            if failed is not None:
+                failed.append(gateway)
+            raise GatewayStreamError(gateway, e) from e
+    finally:
+        response.close()
+
+# imghdr only needs the first few bytes, so the first chunk is enough to pick an extension
+def _sniff_filename(cid: str, first_chunk: bytes) -> str:
+    ext = imghdr.what(None, h=first_chunk) or "bin"
+    return f"{cid}.{ext}"
+
+# Serve from the local CID cache when possible, otherwise from a gateway while filling the cache.
+# Returns (first chunk, iterator over all chunks) or None
+def _open_source(cid: str, hedged: bool = True, use_cache: bool = True, exclude=(), failed: list = None):
+    if use_cache:
+        cached = cid_cache.get(cid)
+        if cached:
+            chunks = cid_cache.iter_cached(cached)
+            try:
+                first_chunk = next(chunks, b"")
+            except FileNotFoundError:
+                # Evicted by another process after verification; an open file stays readable
+                print(f"💾 Cache entry for {cid} vanished, falling back to gateways")
+            else:
+                print(f"💾 Cache hit: {cid}")
+                return first_chunk, itertools.chain([first_chunk], chunks)
+
+    stream = open_ipfs_stream(cid, hedged, exclude)
+    if stream is None:
+        return None
+    chunks = _iter_stream(stream, failed)
+    if use_cache:
+        chunks = cid_cache.tee(cid, chunks)
+    return stream[2], chunks
+
+@timed("download.download_from_ipfs")
+def download_from_ipfs(cid: str, hedged: bool = True, use_cache: bool = True):
+    failed = []
+    while True:
+        source = _open_source(cid, hedged, use_cache, exclude=failed, failed=failed)
+        if source is None:
+            return None
+
+        first_chunk, chunks = source
+        filename = _sniff_filename(cid, first_chunk)
+        try:
+            with open(filename, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        except GatewayStreamError as e:
+            # Never leave a truncated file behind; try the next ranked gateway
+            os.remove(filename)
+            print(f"❌ Stream broke at {e}, trying next gateway")
+            continue
+
+        print(f"✅ Downloaded as: {filename}")
+        return filename
+
+# Upload an iterable of chunks straight to the storage REST API (chunked transfer encoding)
+def _stream_to_supabase(file_name: str, chunks) -> str:
+    content_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+    response = requests.post(
+        f"{SUPABASE_URL}/storage/v1/object/{BUCKET_NAME}/{file_name}",
+        data=chunks,
+        headers={
+            "Authorization": f"Bearer {SUPABASE_KEY}",
+            "apikey": SUPABASE_KEY,
+            "Content-Type": content_type
+        }
+    )
+    response.raise_for_status()
+    return supabase.storage.from_(BUCKET_NAME).get_public_url(file_name)
+
+def _iter_file(file_path: str):
+    with open(file_path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+@timed("download.upload_to_supabase")
 def upload_to_supabase(file_path: str):
     file_name = os.path.basename(file_path)
-    with open(file_path, "rb") as f:
-        file_data = f.read()
-    supabase.storage.from_(BUCKET_NAME).upload(file_name, file_data)
-    url = supabase.storage.from_(BUCKET_NAME).get_public_url(file_name)
+    url = _stream_to_supabase(file_name, _iter_file(file_path))
     print(f"📤 Uploaded to Supabase: {url}")
     return url
 
+# Pipe gateway (or cache) chunks straight into storage: no temp file, memory bounded by CHUNK_SIZE
+@timed("download.stream_ipfs_to_supabase")
+def stream_ipfs_to_supabase(cid: str, hedged: bool = True, use_cache: bool = True):
+    failed = []
+    while True:
+        tried = len(failed)
+        source = _open_source(cid, hedged, use_cache, exclude=failed, failed=failed)
+        if source is None:
+            return None
+
+        first_chunk, chunks = source
+        file_name = _sniff_filename(cid, first_chunk)
+        try:
+            url = _stream_to_supabase(file_name, chunks)
+        except Exception:
+            # The HTTP client may wrap the body error, so check whether the gateway side broke;
+            # an aborted chunked upload is not stored, so the next gateway can start over
+            if len(failed) == tried:
+                raise
+            print(f"❌ Stream broke at {failed[-1]}, trying next gateway")
+            continue
+        print(f"📤 Streamed to Supabase: {url}")
+        return url
+
 def main(cid):
-    file_path = download_from_ipfs(cid)
-    if file_path:
-        upload_to_supabase(file_path)
+    return stream_ipfs_to_supabase(cid)
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
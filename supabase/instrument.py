@@ -0,0 +1,191 @@
+import os
+import time
+import threading
+import functools
+import contextvars
+
+# Opt-in latency instrumentation for the public db/upload/download functions.
+# Off by default (one flag check per call); turn on with ZKH_TIMING=1 or enable().
+# While on, every HTTP round trip made through requests or httpx is counted and
+# charged to the innermost timed function running in the current context.
+MAX_SAMPLES = 100000
+# Histogram bucket upper bounds in milliseconds: 0.25, 0.5, 1, ... ~65 s
+BUCKETS_MS = [0.25 * 2 ** i for i in range(19)]
+
+_enabled = os.getenv("ZKH_TIMING") == "1"
+_lock = threading.Lock()
+_stages = {}
+_current_stage = contextvars.ContextVar("stage", default="(unattributed)")
+_originals = {}
+
+def _stage(name: str) -> dict:
+    stage = _stages.get(name)
+    if stage is None:
+        stage = _stages[name] = {
+            "calls": 0,
+            "errors": 0,
+            "samples": [],
+            "buckets": [0] * (len(BUCKETS_MS) + 1),
+            "round_trips": 0,
+            "bytes_out": 0,
+            "bytes_in": 0
+        }
+    return stage
+
+def _record_latency(name: str, elapsed_ms: float, failed: bool):
+    with _lock:
+        stage = _stage(name)
+        stage["calls"] += 1
+        stage["errors"] += failed
+        if len(stage["samples"]) < MAX_SAMPLES:
+            stage["samples"].append(elapsed_ms)
+        for index, bound in enumerate(BUCKETS_MS):
+            if elapsed_ms <= bound:
+                stage["buckets"][index] += 1
+                break
+        else:
+            stage["buckets"][-1] += 1
+
+def record_round_trip(bytes_out: int = 0, bytes_in: int = 0):
+    if not _enabled:
+        return
+    with _lock:
+        stage = _stage(_current_stage.get())
+        stage["round_trips"] += 1
+        stage["bytes_out"] += bytes_out
+        stage["bytes_in"] += bytes_in
+
+def timed(name: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            token = _current_stage.set(name)
+            start = time.perf_counter()
+            failed = False
+            try:
+                return fn(*args, **kwargs)
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                _record_latency(name, (time.perf_counter() - start) * 1000, failed)
+                _current_stage.reset(token)
+        return wrapper
+    return decorator
+
+def _body_size(body) -> int:
+    return len(body) if isinstance(body, (bytes, bytearray, str)) else 0
+
+def _content_length(headers) -> int:
+    try:
+        return int(headers.get("content-length") or 0)
+    except ValueError:
+        return 0
+
+def _counting(body, counter: list):
+    for chunk in body:
+        counter[0] += len(chunk)
+        yield chunk
+
+# Wrap the transport send methods so round trips and bytes are counted without touching call sites.
+# Chunked request bodies (iterables sent without Content-Length) are counted as they are sent;
+# streamed responses only count what Content-Length declares
+def _patch_transports():
+    try:
+        import requests
+        original = requests.Session.send
+        _originals[(requests.Session, "send")] = original
+
+        def send(self, request, **kwargs):
+            counter = None
+            body = request.body
+            if (body is not None and not isinstance(body, (bytes, bytearray, str))
+                    and "Content-Length" not in request.headers):
+                counter = [0]
+                request.body = _counting(body, counter)
+            response = original(self, request, **kwargs)
+            bytes_out = counter[0] if counter else _body_size(body) or _content_length(request.headers)
+            record_round_trip(bytes_out, _content_length(response.headers))
+            return response
+        requests.Session.send = send
+    except ImportError:
+        pass
+
+    try:
+        import httpx
+        original_httpx = httpx.Client.send
+        _originals[(httpx.Client, "send")] = original_httpx
+
+        def send_httpx(self, request, **kwargs):
+            response = original_httpx(self, request, **kwargs)
+            record_round_trip(_content_length(request.headers), _content_length(response.headers))
+            return response
+        httpx.Client.send = send_httpx
+    except ImportError:
+        pass
+
+def _restore_transports():
+    for (cls, attr), original in _originals.items():
+        setattr(cls, attr, original)
+    _originals.clear()
+
+def enable():
+    global _enabled
+    if not _originals:
+        _patch_transports()
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+    _restore_transports()
+
+def reset():
+    with _lock:
+        _stages.clear()
+
+def _percentile(samples: list, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+# Per-stage summary: call/error counts, latency percentiles (ms), histogram, round trips and bytes
+def report() -> dict:
+    with _lock:
+        stages = {name: dict(stage, samples=list(stage["samples"])) for name, stage in _stages.items()}
+    summary = {}
+    for name, stage in sorted(stages.items()):
+        samples = stage["samples"]
+        summary[name] = {
+            "calls": stage["calls"],
+            "errors": stage["errors"],
+            "mean_ms": sum(samples) / len(samples) if samples else 0.0,
+            "p50_ms": _percentile(samples, 0.50),
+            "p90_ms": _percentile(samples, 0.90),
+            "p99_ms": _percentile(samples, 0.99),
+            "max_ms": max(samples) if samples else 0.0,
+            "histogram": {
+                (f"<={bound:g}ms" if index < len(BUCKETS_MS) else f">{BUCKETS_MS[-1]:g}ms"): count
+                for index, (bound, count) in enumerate(zip(BUCKETS_MS + [None], stage["buckets"]))
+                if count
+            },
+            "round_trips": stage["round_trips"],
+            "bytes_out": stage["bytes_out"],
+            "bytes_in": stage["bytes_in"]
+        }
+    return summary
+
+def print_report():
+    print(f"{'stage':<40} {'calls':>6} {'err':>4} {'p50ms':>9} {'p90ms':>9} {'p99ms':>9} {'rtts':>6} {'MB out':>8} {'MB in':>8}")
+    for name, stage in report().items():
+        print(
+            f"{name:<40} {stage['calls']:>6} {stage['errors']:>4} "
+            f"{stage['p50_ms']:>9.2f} {stage['p90_ms']:>9.2f} {stage['p99_ms']:>9.2f} "
+            f"{stage['round_trips']:>6} {stage['bytes_out'] / 1e6:>8.2f} {stage['bytes_in'] / 1e6:>8.2f}"
+        )
+
+if _enabled:
+    enable()
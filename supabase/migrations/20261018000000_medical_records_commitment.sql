@@ -0,0 +1,5 @@
+-- Poseidon(SHA-256) file commitment written by db.add_medical_record and
+-- db.add_medical_records_bulk (decimal string, as commitment.py and src/zk/server.js produce it).
+-- Nullable so records inserted without one keep working
+alter table if exists medical_records
+  add column if not exists commitment text;
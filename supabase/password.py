@@ -1,19 +1,86 @@
+import os
+import time
+import asyncio
+import threading
 import bcrypt
+from concurrent.futures import ProcessPoolExecutor
 
-def hash_password(password: str) -> str:
-    hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+# bcrypt cost (log2 rounds) for new hashes; see calibrate_cost to pick one for this hardware
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+MIN_ROUNDS = 10
+MAX_ROUNDS = 16
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def hash_password(password: str, rounds: int = None) -> str:
+    hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds or BCRYPT_ROUNDS))
     return hashed.decode()
 
 def verify_password(password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(password.encode(), hashed_password.encode())
 
-def register_user(password: str) -> dict:
+# A bcrypt hash looks like $2b$<cost>$<salt+hash>
+def hash_cost(hashed_password: str) -> int:
+    return int(hashed_password.split("$")[2])
+
+def needs_rehash(hashed_password: str, rounds: int = None) -> bool:
+    return hash_cost(hashed_password) != (rounds or BCRYPT_ROUNDS)
+
+# Pick the highest cost whose hash time stays within target_ms on this machine.
+# Returns None if even MIN_ROUNDS is slower than the target, rather than a cost that misses it
+def calibrate_cost(target_ms: float = 250, samples: int = 3) -> int:
+    cost = None
+    for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+        salt = bcrypt.gensalt(rounds)
+        start = time.perf_counter()
+        for _ in range(samples):
+            bcrypt.hashpw(b"calibration", salt)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / samples
+        if elapsed_ms > target_ms:
+            if cost is None:
+                print(f"⚠️ Cost {MIN_ROUNDS} takes {elapsed_ms:.1f}ms, over the {target_ms:g}ms target")
+            break
+        cost = rounds
+        # Each extra round doubles the work, so stop before the next one overshoots
+        if elapsed_ms * 2 > target_ms:
+            break
+    return cost
+
+def register_user(password: str, rounds: int = None) -> dict:
     if len(password) < 8:
         return {"success": False, "error": "Password too short"}
-    hashed = hash_password(password)
+    hashed = hash_password(password, rounds)
     return {"success": True, "password_hash": hashed}
 
-def authenticate_user(input_password: str, stored_hash: str) -> dict:
-    if verify_password(input_password, stored_hash):
-        return {"success": True}
-    return {"success": False, "error": "Invalid password"}
+# On success with an outdated cost, the result carries a fresh "password_hash" to store
+def authenticate_user(input_password: str, stored_hash: str, rounds: int = None) -> dict:
+    if not verify_password(input_password, stored_hash):
+        return {"success": False, "error": "Invalid password"}
+    if needs_rehash(stored_hash, rounds):
+        return {"success": True, "rehashed": True, "password_hash": hash_password(input_password, rounds)}
+    return {"success": True}
+
+# Hashing is CPU-bound, so the async API runs it in a process pool sized to the cores
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=os.cpu_count())
+        return _executor
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+# Workers don't see changes to BCRYPT_ROUNDS made after they start, so pass the cost explicitly
+async def register_user_async(password: str) -> dict:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), register_user, password, BCRYPT_ROUNDS)
+
+async def authenticate_user_async(input_password: str, stored_hash: str) -> dict:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), authenticate_user, input_password, stored_hash, BCRYPT_ROUNDS)
@@ -1,8 +1,18 @@
 
 import os
+import json
+import hashlib
+import random
+import threading
+import time
 from supabase import create_client, Client
 from dotenv import load_dotenv
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from cid import CidHasher, cid_of_file, CHUNK_SIZE
+from commitment import commitment_from_sha256
+from instrument import timed
 
 # Load secrets from .env
 load_dotenv()
@@ -10,37 +20,202 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 PINATA_JWT = os.getenv("PINATA_JWT")
+PINATA_API_URL = os.getenv("PINATA_API_URL", "https://api.pinata.cloud")
 BUCKET_NAME = "medical-records"
 
+# CIDs are computed locally, so Pinata must be asked for the same CID version
+CID_VERSION = int(os.getenv("IPFS_CID_VERSION", "0"))
+# Local record of what has already been pinned / stored, one JSON line per change:
+# {"cid": str, "pinned": bool} or {"cid": str, "url": str}, later lines win
+PINNED_INDEX_PATH = os.getenv("PINNED_INDEX_PATH", ".pinned_cids.jsonl")
+
+# Retries with exponential backoff and jitter for transient network/5xx failures
+MAX_RETRIES = int(os.getenv("UPLOAD_MAX_RETRIES", "3"))
+RETRY_BACKOFF = float(os.getenv("UPLOAD_RETRY_BACKOFF", "0.5"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# One pooled session for every Pinata call, so batch uploads reuse TLS connections
+pinata = requests.Session()
+pinata.headers["Authorization"] = f"Bearer {PINATA_JWT}"
+pinata.mount(PINATA_API_URL, HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE))
+
+# Pooled session for direct storage API calls that supabase-py doesn't expose
+storage_http = requests.Session()
+storage_http.headers.update({"Authorization": f"Bearer {SUPABASE_KEY}", "apikey": SUPABASE_KEY})
+storage_http.mount(f"{SUPABASE_URL}/storage/", HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE))
+
+_index_lock = threading.Lock()
+_index = None
+
+# HTTP status behind a requests/httpx error or a storage3 exception, if there is one
+def _status_code(error: Exception):
+    response = getattr(error, "response", None)
+    if response is not None:
+        return response.status_code
+    status = getattr(error, "status", None)
+    if status is None and error.args and isinstance(error.args[0], dict):
+        status = error.args[0].get("statusCode")
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        pass
+    if isinstance(error.__cause__, httpx.HTTPStatusError):
+        return error.__cause__.response.status_code
+    return None
+
+# Only connection failures, timeouts, 429 and 5xx are worth another attempt;
+# auth errors, bad requests, oversized bodies and local file errors are not
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, httpx.TransportError,
+                          ConnectionError, TimeoutError)):
+        return True
+    status = _status_code(error)
+    return status is not None and (status == 429 or status >= 500)
+
+def with_retries(fn, *args, **kwargs):
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == MAX_RETRIES or not _retryable(e):
+                raise
+            delay = RETRY_BACKOFF * 2 ** attempt * (1 + random.random())
+            print(f"🔁 Retry {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s: {e}")
+            time.sleep(delay)
+
+# Parsed lines of an append-only JSON-lines file, oldest first; a missing file has none
+def read_json_lines(path: str) -> list:
+    entries = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A crash mid-append leaves at most one torn line
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+def load_index() -> dict:
+    index = {}
+    for change in read_json_lines(PINNED_INDEX_PATH):
+        index.setdefault(change.pop("cid"), {"pinned": False, "url": None}).update(change)
+    return index
+
+# Ask Pinata whether a CID is already pinned (metadata only, no file transfer)
+@timed("upload.is_pinned")
+def is_pinned(cid: str) -> bool:
+    url = f"{PINATA_API_URL}/data/pinList"
+    params = {"hashContains": cid, "status": "pinned"}
+    response = pinata.get(url, params=params)
+    response.raise_for_status()
+    return any(row["ipfs_pin_hash"] == cid for row in response.json().get("rows", []))
+
+@timed("upload.upload_to_ipfs")
 def upload_to_ipfs(file_path):
-    url = "https://api.pinata.cloud/pinning/pinFileToIPFS"
-    headers = {
-        "Authorization": f"Bearer {PINATA_JWT}"
-    }
+    url = f"{PINATA_API_URL}/pinning/pinFileToIPFS"
+    data = {"pinataOptions": json.dumps({"cidVersion": CID_VERSION})}
     with open(file_path, "rb") as fp:
         files = {"file": (os.path.basename(file_path), fp)}
-        response = requests.post(url, files=files, headers=headers)
+        response = pinata.post(url, files=files, data=data)
         response.raise_for_status()
         return response.json()["IpfsHash"]
 
-def upload_to_supabase(file_path):
-    file_name = os.path.basename(upload_to_ipfs(file_path))
+# HEAD the CID-named object so stored content is never re-read or re-sent
+@timed("upload.exists_in_supabase")
+def exists_in_supabase(cid: str) -> bool:
+    response = storage_http.head(f"{SUPABASE_URL}/storage/v1/object/{BUCKET_NAME}/{cid}")
+    # Storage answers 400 (with a 404 statusCode in the body) for missing objects
+    if response.status_code in (400, 404):
+        return False
+    response.raise_for_status()
+    return True
+
+# Objects are named by CID, computed locally unless the caller already has it
+@timed("upload.upload_to_supabase")
+def upload_to_supabase(file_path, cid=None):
+    file_name = cid or cid_of_file(file_path, CID_VERSION)
     with open(file_path, "rb") as f:
         file_data = f.read()
-    supabase.storage.from_(BUCKET_NAME).upload(file_name, file_data)
+    try:
+        supabase.storage.from_(BUCKET_NAME).upload(file_name, file_data)
+    except Exception as e:
+        # Objects are content-addressed, so an existing one already holds these bytes
+        if "Duplicate" not in str(e):
+            raise
     public_url = supabase.storage.from_(BUCKET_NAME).get_public_url(file_name)
     return public_url
 
-def main(file_path):
-    print("📤 Uploading to IPFS...")
-    cid = upload_to_ipfs(file_path)
-    print("✅ IPFS CID:", cid)
+# The index is read once per process; each change is then appended as one line
+def _loaded_index() -> dict:
+    global _index
+    if _index is None:
+        _index = load_index()
+    return _index
+
+def _index_entry(cid: str) -> dict:
+    with _index_lock:
+        return dict(_loaded_index().get(cid, {"pinned": False, "url": None}))
+
+def _update_index(cid: str, **fields):
+    with _index_lock:
+        entry = _loaded_index().setdefault(cid, {"pinned": False, "url": None})
+        if all(entry.get(key) == value for key, value in fields.items()):
+            return
+        entry.update(fields)
+        with open(PINNED_INDEX_PATH, "a") as f:
+            f.write(json.dumps({"cid": cid, **fields}) + "\n")
+
+# One read of the file yields both its CID and its Poseidon(SHA-256) commitment
+def fingerprint(file_path) -> tuple:
+    hasher = CidHasher(CID_VERSION)
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            hasher.update(chunk)
+            sha.update(chunk)
+    return hasher.cid(), commitment_from_sha256(sha.digest())["decimal"]
+
+# Pin and store one file, skipping whatever is already done.
+# The result's cid/file_url/commitment keys match db.add_medical_record's arguments
+@timed("upload.upload_file")
+def upload_file(file_path) -> dict:
+    cid, commitment = fingerprint(file_path)
+    print("🔢 Local CID:", cid)
+
+    entry = _index_entry(cid)
+    if entry["pinned"] or with_retries(is_pinned, cid):
+        print("♻️ Already pinned, skipping IPFS upload")
+    else:
+        print("📤 Uploading to IPFS...")
+        pinned_cid = with_retries(upload_to_ipfs, file_path)
+        if pinned_cid != cid:
+            # The file is pinned under another CID, so the local one must not be recorded or returned
+            raise ValueError(f"Pinata returned {pinned_cid}, expected {cid}")
+        print("✅ IPFS CID:", pinned_cid)
+    _update_index(cid, pinned=True)
 
-    print("📤 Uploading to Supabase...")
-    supabase_url = upload_to_supabase(file_path)
-    print("✅ Supabase URL:", supabase_url)
+    url = entry["url"]
+    if url:
+        print("♻️ Already in Supabase, skipping upload")
+    elif with_retries(exists_in_supabase, cid):
+        print("♻️ Already in Supabase storage, skipping upload")
+        url = supabase.storage.from_(BUCKET_NAME).get_public_url(cid)
+        _update_index(cid, url=url)
+    else:
+        print("📤 Uploading to Supabase...")
+        url = with_retries(upload_to_supabase, file_path, cid)
+        _update_index(cid, url=url)
+    print("✅ Supabase URL:", url)
+    return {"cid": cid, "file_url": url, "commitment": commitment}
+
+def main(file_path):
+    result = upload_file(file_path)
+    return result["cid"], result["file_url"]
 
 if __name__ == "__main__":
     import sys